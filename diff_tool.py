@@ -1,26 +1,48 @@
 import os
+import sys
 import json
 import subprocess
 import io
+import re
+import fnmatch
+import shutil
+import tempfile
+import zipfile
 import mimetypes
 
+from collections import deque
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from functools import lru_cache
+
 import pathspec
 
 from datetime import datetime
+from xml.sax.saxutils import escape
 
 from PIL import Image
 
-from difflib import SequenceMatcher
+from lxml import etree
 
 from docx import Document
 from docx.enum.table import WD_ALIGN_VERTICAL
-from docx.shared import Pt, RGBColor, Inches, Cm
+from docx.shared import Pt, Inches, Cm, Emu
 from docx.oxml import parse_xml
-from docx.oxml.ns import nsdecls
+from docx.oxml.ns import nsdecls, qn
+from docx.opc import phys_pkg
 
 from pygments import lex
-from pygments.lexers import guess_lexer_for_filename, guess_lexer
+from pygments.lexers import get_all_lexers, find_lexer_class, guess_lexer_for_filename, guess_lexer
+from pygments.lexers.special import TextLexer
 from pygments.styles import get_style_by_name
+from pygments.util import ClassNotFound
+
+# orjson is optional; it parses the configuration and language files faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # The directory where this script is located
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -43,15 +65,47 @@ def print_yellow(text: str):
 def print_red(text: str):
     print(f"\033[91m{text}\033[0m")
 
-def is_binary_string(bytes_data):
-    textchars = bytearray({7, 8, 9, 10, 12, 13, 27}
-                          | set(range(0x20, 0x100)) - {0x7f})
-    return bool(bytes_data.translate(None, textchars))
-
 def is_image_file(filename):
     mimetype, _ = mimetypes.guess_type(filename)
     return mimetype and mimetype.startswith("image/")
 
+def unquote_git_path(path):
+    # Git wraps paths containing special characters in quotes with C-style escapes
+    if not path.startswith('"'):
+        return path
+    escapes = {"a": 7, "b": 8, "t": 9, "n": 10, "v": 11, "f": 12, "r": 13, '"': 34, "\\": 92}
+    raw = bytearray()
+    i = 1
+    while i < len(path) - 1:
+        char = path[i]
+        if char == "\\":
+            next_char = path[i + 1]
+            if next_char in escapes:
+                raw.append(escapes[next_char])
+                i += 2
+            else:
+                raw.append(int(path[i + 1:i + 4], 8))
+                i += 4
+        else:
+            raw.extend(char.encode("utf-8"))
+            i += 1
+    return raw.decode("utf-8", errors="replace")
+
+def parse_diff_path(header):
+    # Without rename detection both sides of "diff --git a/<path> b/<path>" are the same path
+    paths = header[len("diff --git "):]
+    if paths.startswith('"'):
+        return unquote_git_path(paths[:len(paths) // 2])[2:]
+    return paths[2:(len(paths) - 1) // 2]
+
+# Read a JSON file, with orjson if it is installed
+def load_json(path):
+    if orjson:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
 def get_usable_width(document):
     section = document.sections[0]
     page_width = section.page_width
@@ -59,16 +113,43 @@ def get_usable_width(document):
     right_margin = section.right_margin
     return page_width - left_margin - right_margin  # in EMUs
 
-def remove_cell_border(cell, borders=("top", "left", "bottom", "right")):
-    tc = cell._tc
-    tcPr = tc.get_or_add_tcPr()
-    tcBorders = parse_xml(r'<w:tcBorders {}/>'.format(nsdecls('w')))
-    for border in borders:
-        border_element = parse_xml(
-            f'<w:{border} w:val="nil" {nsdecls("w")}/>'
-        )
-        tcBorders.append(border_element)
-    tcPr.append(tcBorders)
+# Control characters, surrogates and the noncharacters U+FFFE and U+FFFF are not
+# allowed in XML text
+invalid_xml_chars = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]")
+
+def xml_text(text):
+    return escape(invalid_xml_chars.sub("", text))
+
+def run_xml(text, run_properties):
+    # Tabs become <w:tab/> elements, as python-docx does for add_run()
+    content = "<w:tab/>".join(
+        f'<w:t xml:space="preserve">{xml_text(part)}</w:t>' if part else ""
+        for part in text.split("\t")
+    )
+    if run_properties:
+        run_properties = f"<w:rPr>{run_properties}</w:rPr>"
+    return f"<w:r>{run_properties}{content}</w:r>"
+
+def cell_borders_xml(borders):
+    return "<w:tcBorders>" + "".join(f'<w:{border} w:val="nil"/>' for border in borders) + "</w:tcBorders>"
+
+def start_cat_file():
+    # One long-lived "git cat-file --batch" process serves all blob reads,
+    # instead of spawning a "git show" per file and commit
+    return subprocess.Popen(
+        ["git", "cat-file", "--batch"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    )
+
+def read_blob(cat_file, rev):
+    cat_file.stdin.write(rev.encode("utf-8") + b"\n")
+    cat_file.stdin.flush()
+    header = cat_file.stdout.readline()
+    if not header or header.endswith(b" missing\n") or header.endswith(b" ambiguous\n"):
+        return b""
+    _, object_type, size = header.split()
+    content = cat_file.stdout.read(int(size) + 1)[:-1]  # strip trailing LF
+    return content if object_type == b"blob" else b""
 
 # ------------------------------------------------------------------------------
 # Configuration
@@ -78,10 +159,28 @@ if not os.path.exists(config_file):
     print_red(f"Error: Configuration file not found: {config_file}")
     exit()
 
-with open(config_file, "r", encoding="utf-8") as f:
-    config = json.load(f)
+config = load_json(config_file)
 
 file_encoding = config.get("file_encoding", "utf-8")
+diff_font = config.get("diff_font", "Courier New")
+diff_font_size = Pt(int(config.get("diff_font_size", 8)))
+heading_level = config.get("heading_level", 2)
+add_color = config.get("add_color", "D0FFD0")
+remove_color = config.get("remove_color", "FFD0D0")
+neutral_color = config.get("neutral_color", "F5F5F5")
+add_symbol = config.get("add_symbol", "+")
+remove_symbol = config.get("remove_symbol", "-")
+neutral_symbol = config.get("neutral_symbol", "=")
+include_unchanged_lines = config.get("include_unchanged_lines", True)
+include_images = config.get("include_images", True)
+insert_page_breaks = config.get("insert_page_breaks", True)
+worker_processes = config.get("worker_processes", 1)
+compress_level = config.get("compress_level", 1)
+max_diff_lines = config.get("max_diff_lines", 0)
+diff_algorithm = config.get("diff_algorithm", "histogram")
+diff_layout = config.get("diff_layout", "table")
+max_line_chars = config.get("max_line_chars", 2000)
+guess_unknown_lexers = config.get("guess_unknown_lexers", False)
 
 # ------------------------------------------------------------------------------
 # Pygments style configuration
@@ -93,6 +192,67 @@ try:
 except Exception:
     token_styles = get_style_by_name("default").styles
 
+# Built-in lexer classes per file name pattern of theirs, so that the lexers
+# claiming a file name are found without matching it against every pattern, as
+# guess_lexer_for_filename() does. Literal names ("CMakeLists.txt") and
+# suffixes ("*.py") are looked up in dicts; only the few other patterns
+# ("*.php[345]") are matched one by one.
+# Plugin lexers are left to guess_lexer_for_filename(), as looking them up is slow.
+name_lexers = {}
+suffix_lexers = {}
+wildcard_lexers = []
+for lexer_name, _, _, _ in get_all_lexers(plugins=False):
+    lexer_class = find_lexer_class(lexer_name)
+    for pattern in (*lexer_class.filenames, *lexer_class.alias_filenames):
+        if not any(char in pattern for char in "*?["):
+            name_lexers.setdefault(pattern, set()).add(lexer_class)
+        elif pattern.startswith("*") and not any(char in pattern[1:] for char in "*?["):
+            suffix_lexers.setdefault(pattern[1:], set()).add(lexer_class)
+        else:
+            wildcard_lexers.append((re.compile(fnmatch.translate(pattern)), lexer_class))
+
+# The built-in lexer classes whose file name patterns match a file name
+@lru_cache(maxsize=None)
+def filename_lexer_classes(name):
+    lexer_classes = set(name_lexers.get(name, ()))
+    for i in range(len(name)):
+        lexer_classes.update(suffix_lexers.get(name[i:], ()))
+    lexer_classes.update(lexer_class for regex, lexer_class in wildcard_lexers if regex.match(name))
+    return lexer_classes
+
+# One lexer per lexer class is shared by all files, so that lines lexed for
+# one file are reused for the others by code_runs_xml()
+@lru_cache(maxsize=None)
+def shared_lexer(lexer_class):
+    return lexer_class()
+
+# File names that no built-in lexer claims (like "README" or ".gitignore") are
+# looked up among the plugin lexers once per name; None if no lexer claims them
+@lru_cache(maxsize=None)
+def plugin_lexer_class(name):
+    try:
+        return type(guess_lexer_for_filename(name, ""))
+    except ClassNotFound:
+        return None
+
+def get_lexer(filename, sample):
+    name = os.path.basename(filename)
+    lexer_classes = filename_lexer_classes(name)
+    if len(lexer_classes) == 1:
+        return shared_lexer(next(iter(lexer_classes)))
+    if lexer_classes:
+        # File names claimed by several lexers (like ".h" for C, C++ and
+        # Objective-C) are told apart by the content of each file
+        return shared_lexer(type(guess_lexer_for_filename(filename, sample)))
+    lexer_class = plugin_lexer_class(name)
+    if lexer_class:
+        return shared_lexer(lexer_class)
+    if guess_unknown_lexers:
+        return shared_lexer(type(guess_lexer(sample or "")))
+    # Otherwise unknown file types are shown as plain text, which skips
+    # running every lexer's content analysis on them
+    return shared_lexer(TextLexer)
+
 # ------------------------------------------------------------------------------
 # Localization
 
@@ -107,107 +267,84 @@ if not os.path.exists(lang_file):
     print_red(f"Language '{lang_choice}' not found, defaulting to English if available.")
     lang_file = os.path.join(lang_dir, "en.json")
 
-with open(lang_file, "r", encoding="utf-8") as f:
-    lang = json.load(f)
-
-# ------------------------------------------------------------------------------
-# Show banner
-
-print_green(lang["title"])
+lang = load_json(lang_file)
 
 # ------------------------------------------------------------------------------
-# Input prompts
-
-while True:
-    target_dir = input(lang["enter_target_dir"] + " ").strip()
-    if not os.path.isdir(target_dir):
-        print_red(lang["invalid_target_dir"])
-        continue
-    if ".git" not in os.listdir(target_dir):
-        print_red(lang["no_git_repo_found"].format(target_dir=target_dir))
-        if ask_yes_no(lang["still_continue"], lang):
-            break
-        continue
-    os.chdir(target_dir)
-    break
-
-# GDDIgnore
-gdd_ignore_filename = config.get("gdd_ignore_file_name", ".gddignore")
-gdd_ignore_path = os.path.join(target_dir, gdd_ignore_filename)
-ignore_spec = None
-
-if os.path.exists(gdd_ignore_path):
-    with open(gdd_ignore_path, "r", encoding="utf-8") as f:
-        ignore_spec = pathspec.PathSpec.from_lines("gitwildmatch", f)
-
-# FIRST COMMIT
-commit1 = input(lang["enter_commit1"] + " ").strip()
-commit1_specified = bool(commit1)
-if not commit1_specified:
-    commit1 = subprocess.run(
-        ["git", "rev-list", "--max-parents=0", "HEAD"],
-        capture_output=True, text=True, encoding="utf-8"
-    ).stdout.strip()
-
-# Special case: if commit1 is the very first commit, we cannot add a caret
-very_first_commit_hash = subprocess.run(
-    ["git", "rev-list", "--max-parents=0", "HEAD"],
-    capture_output=True, text=True, encoding="utf-8"
-).stdout.strip()
-is_very_first_commit = (commit1 == very_first_commit_hash)
-
-
-if not (commit1.endswith("^") or "~" in commit1) and commit1 != "HEAD":
-    include_first_commit = config.get("include_first_commit", False)
-
-    if is_very_first_commit and include_first_commit:
-        # Special revision number for an empty tree (state before any commit)
-        empty_tree = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
-        commit1 = empty_tree
-    elif include_first_commit:
-        commit1 = f"{commit1}^" if include_first_commit else commit1
-
-if not commit1_specified:
-    print(lang["using_first_commit"].format(commit1=commit1))
-
-# LAST COMMIT
-commit2 = input(lang["enter_commit2"] + " ").strip()
-if not commit2:
-    commit2 = subprocess.run(
-        ["git", "rev-parse", "HEAD"],
-        capture_output=True, text=True, encoding="utf-8"
-    ).stdout.strip()
-    print(lang["using_last_commit"].format(commit2=commit2))
-
-output_docx = input(lang["enter_output_docx"] + " ").strip()
-if not output_docx:
-    output_docx = os.path.join(script_dir, "output.docx")
-    print(lang["using_default_output"].format(output_docx=output_docx))
-
-# ------------------------------------------------------------------------------
-# Diff generation
-changed_files = subprocess.run(
-    ["git", "diff", "--name-only", commit1, commit2],
-    capture_output=True, text=True, encoding="utf-8"
-).stdout.splitlines()
-
-changed_files = [f for f in changed_files if f != gdd_ignore_filename]
-
-if ignore_spec:
-    changed_files = [f for f in changed_files if not ignore_spec.match_file(f)]
-
-if not changed_files:
-    print_yellow(lang["no_changes_found"].format(commit1=commit1, commit2=commit2))
-    exit()
+# Diff parsing
+
+# Unchanged, added and removed lines inside a hunk
+hunk_line_prefixes = {b" ", b"+", b"-"}
+
+# Split the output of "git diff" into (file, is_binary, hunk_lines) per changed file;
+# the "--numstat" lines that precede the first file (if requested) are returned separately.
+# The output is read as bytes: paths are decoded as UTF-8 (as git stores them), while
+# hunk lines stay bytes until the file is rendered, so ignored files are never decoded.
+def split_file_diffs(diff_output):
+    numstat_lines = []
+    file_diffs = []
+    hunk_lines = None
+    in_hunk = False
+    for line in diff_output:
+        line = line.rstrip(b"\r\n")
+        # The first character decides the kind of a line, so it is checked once
+        # and lines inside hunks (by far the most) are handled first
+        prefix = line[:1]
+        if in_hunk and prefix in hunk_line_prefixes:
+            hunk_lines.append(line)
+        elif prefix == b"@":
+            in_hunk = True
+            hunk_lines.append(line)
+        elif in_hunk and prefix == b"\\":
+            # Skip "\ No newline at end of file" markers
+            continue
+        elif line.startswith(b"diff --git "):
+            hunk_lines = []
+            in_hunk = False
+            file_diffs.append([parse_diff_path(line.decode("utf-8", errors="replace")), False, hunk_lines])
+        elif hunk_lines is None:
+            if line:
+                numstat_lines.append(line.decode("utf-8", errors="replace"))
+        elif line.startswith(b"Binary files "):
+            file_diffs[-1][1] = True
+    return numstat_lines, file_diffs
+
+# Number of changed (added plus removed) lines per file from "git diff --numstat";
+# binary files are reported with "-" and get None
+def parse_numstat(numstat_output):
+    changed_lines = {}
+    for line in numstat_output:
+        added, removed, file = line.rstrip("\n").split("\t", 2)
+        if added == "-":
+            changed_lines[unquote_git_path(file)] = None
+        else:
+            changed_lines[unquote_git_path(file)] = int(added) + int(removed)
+    return changed_lines
+
+# Pair the lines of git diff hunks with their line numbers (removed lines are
+# numbered in the old file), skipping unchanged lines unless they are included
+def numbered_diff_lines(hunk_lines):
+    old_line = new_line = 0
+    for line in hunk_lines:
+        prefix = line[:1]
+        if prefix == "@":
+            parts = line.split(" ")
+            old_line = int(parts[1].split(",")[0][1:])
+            new_line = int(parts[2].split(",")[0][1:])
+        elif prefix == "-":
+            yield line, old_line
+            old_line += 1
+        else:
+            if prefix == "+" or include_unchanged_lines:
+                yield line, new_line
+            new_line += 1
+            if prefix == " ":
+                old_line += 1
 
 # ------------------------------------------------------------------------------
 # Word document generation
 
-doc = Document()
-doc.add_heading(f"{lang['git_changes_report']} ({commit1} → {commit2})", level=1)
-doc.add_paragraph(lang["report_generated_on"].format(
-    date=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-))
+# Namespace declaration of the "w:" prefix for XML fragments that are parsed on their own
+w_nsdecls = nsdecls("w")
 
 # Add legend table
 def add_legend_table(document):
@@ -215,306 +352,596 @@ def add_legend_table(document):
     legend_table.style = "Table Grid"
 
     legend_data = [
-        (lang["legend_add"], config.get("add_color", "D0FFD0"), config.get("add_symbol", "+")),
-        (lang["legend_remove"], config.get("remove_color", "FFD0D0"), config.get("remove_symbol", "-")),
+        (lang["legend_add"], add_color, add_symbol),
+        (lang["legend_remove"], remove_color, remove_symbol),
     ]
 
     # Only include neutral/unchanged lines in the legend if they're being shown in the diff
-    if config.get("include_unchanged_lines", True):
-        legend_data.append(
-            (lang["legend_neutral"], config.get("neutral_color", "F5F5F5"), config.get("neutral_symbol", "="))
-        )
+    if include_unchanged_lines:
+        legend_data.append((lang["legend_neutral"], neutral_color, neutral_symbol))
 
     for label, color, symbol in legend_data:
         column = legend_table.add_row().cells
         column[0].text = label
 
-        shading = parse_xml(r'<w:shd {} w:fill="{}"/>'.format(nsdecls("w"), color))
+        shading = parse_xml(r'<w:shd {} w:fill="{}"/>'.format(w_nsdecls, color))
         column[1]._element.get_or_add_tcPr().append(shading)
         column[1].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
 
         p = column[1].paragraphs[0]
         run = p.add_run(symbol)
         font = run.font
-        font.name = config.get("diff_font", "Courier New")
-        font.size = Pt(int(config.get("diff_font_size", 8)))
-
-doc.add_heading(lang["legend"], level=config.get("heading_level", 2))
-add_legend_table(doc)
+        font.name = diff_font
+        font.size = diff_font_size
+
+# Width of the symbol column of the diff tables
+symbol_width = Cm(0.57)
+
+# Font and size properties shared by all runs in the diff tables
+escaped_diff_font = escape(diff_font, {'"': "&quot;"})
+font_xml = f'<w:rFonts w:ascii="{escaped_diff_font}" w:hAnsi="{escaped_diff_font}"/>'
+size_xml = f'<w:sz w:val="{int(diff_font_size.pt * 2)}"/>'
+
+# Shading and symbol run for added, removed and unchanged lines, built once
+def line_kind_xml(color, symbol):
+    return f'<w:shd w:fill="{color}"/>', run_xml(symbol, font_xml + size_xml)
+
+add_line_xml = line_kind_xml(add_color, add_symbol)
+remove_line_xml = line_kind_xml(remove_color, remove_symbol)
+neutral_line_xml = line_kind_xml(neutral_color, neutral_symbol)
+line_kinds_xml = {"+": add_line_xml, "-": remove_line_xml}
+
+# Translate the Pygments style of a token type into run properties
+def style_run_properties(style_str):
+    bold = italic = color = ""
+    if style_str:
+        for part in style_str.split():
+            if part == "bold":
+                bold = "<w:b/>"
+            elif part == "italic":
+                italic = "<w:i/>"
+            elif part.startswith("#") and len(part) == 7:
+                hexcode = part.lstrip("#")
+                try:
+                    int(hexcode, 16)
+                    color = f'<w:color w:val="{hexcode.upper()}"/>'
+                except ValueError:
+                    pass
+    return font_xml + bold + italic + color + size_xml
+
+# Run properties of every styled token type, built once so that each token only
+# costs a dict lookup; token types without a style get the plain properties
+token_run_properties = {ttype: style_run_properties(style_str) for ttype, style_str in token_styles.items()}
+plain_run_properties = style_run_properties("")
+
+# Lex and style one line of code as runs. Every line is lexed on its own, so the
+# result only depends on the lexer and the text; context lines, blank lines and
+# boilerplate like "return None" recur a lot and are only lexed once.
+# Adjacent tokens with the same run properties (e.g. names, punctuation and the
+# spaces between them) are merged into one run.
+@lru_cache(maxsize=50000)
+def code_runs_xml(lexer, code_content):
+    # Run properties and text of each token in one pass; the newline Pygments
+    # appends becomes a non-breaking space
+    tokens = [
+        (token_run_properties.get(ttype, plain_run_properties), value.rstrip('\n') or "\u00A0")
+        for ttype, value in lex(code_content, lexer)
+    ]
 
-doc.add_page_break()
-doc.add_heading(lang["diffs"], level=config.get("heading_level", 2))
+    runs = []
+    run_properties = None
+    run_text = []
+    for token_properties, value in tokens:
+        if token_properties != run_properties:
+            if run_text:
+                runs.append(run_xml("".join(run_text), run_properties))
+            run_properties = token_properties
+            run_text = []
+        run_text.append(value)
+
+    if run_text:
+        runs.append(run_xml("".join(run_text), run_properties))
+    return "".join(runs)
+
+# Very long lines (minified or generated code) are cut off with a marker, since
+# lexing them is slow and they are unreadable in the report anyway
+truncated_line_xml = run_xml(f" {lang['line_truncated']}", font_xml + "<w:i/>" + size_xml)
+
+def line_runs_xml(lexer, code_content):
+    if max_line_chars and len(code_content) > max_line_chars:
+        return code_runs_xml(lexer, code_content[:max_line_chars]) + truncated_line_xml
+    return code_runs_xml(lexer, code_content)
+
+# Borders removed from the cells of the first, inner and last row, so that the
+# table has no lines between rows and between the symbol and code columns
+row_position_borders = (["bottom"], ["top", "bottom"], ["top"])
+
+# Start of a diff table row with shading, symbol and borders, up to the code runs
+def diff_row_start_xml(line_kind, removed_borders):
+    shading, symbol_run = line_kind
+    return (
+        "<w:tr>"
+        f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{symbol_width.twips}"/>'
+        f'{cell_borders_xml(["right", *removed_borders])}{shading}</w:tcPr>'
+        f"<w:p>{symbol_run}</w:p></w:tc>"
+        f'<w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{code_width.twips}"/>'
+        f'{cell_borders_xml(["left", *removed_borders])}{shading}</w:tcPr>'
+        '<w:p><w:pPr><w:spacing w:before="0" w:after="0"/></w:pPr>'
+    )
+
+# Build a formatted and syntax-highlighted code diff table as XML
+# The table is assembled as one XML string and parsed once, since add_row() and
+# the cell/run wrappers of python-docx are slow for thousands of lines
+def diff_table_xml(diff_lines, lexer):
+    # Everything of a row up to the code runs only depends on the kind of line
+    # and the row position, so these row starts are built once per table
+    row_starts = {
+        prefix: [diff_row_start_xml(line_kind, borders) for borders in row_position_borders]
+        for prefix, line_kind in (("+", add_line_xml), ("-", remove_line_xml), (" ", neutral_line_xml))
+    }
+    last_row = len(diff_lines) - 1
+    rows = []
+
+    for idx, (line, line_number) in enumerate(diff_lines):
+        # First, inner or last row
+        position = 0 if idx == 0 else 2 if idx == last_row else 1
+
+        # Strip symbol from content and lex and style it
+        rows.append(
+            row_starts.get(line[:1], row_starts[" "])[position]
+            + line_runs_xml(lexer, line[1:])
+            + "</w:p></w:tc></w:tr>"
+        )
 
-# Extract line numbers from git diff
-def extract_line_numbers(diff_lines):
-    line_numbers = []
-    current_line = 0
-    for line in diff_lines:
-        if line.startswith("@@"):
-            parts = line.split(" ")
-            new_file_info = parts[2]
-            start_line = int(new_file_info.split(",")[0][1:])
-            current_line = start_line
-        elif not line.startswith("-"):
-            line_numbers.append(current_line)
-            current_line += 1
-    return line_numbers
-
-# Add a formatted and syntax-highlighted code diff table
-def add_diff_table(document, diff_lines, line_numbers, lexer):
-    table = document.add_table(rows=0, cols=2)
-    table.style = "Table Grid"
-
-    table.columns[0].width = Cm(0.57)
-    table.columns[1].width = get_usable_width(document) - Cm(0.57)
-
-    add_symbol = config.get("add_symbol", "+")
-    remove_symbol = config.get("remove_symbol", "-")
-    neutral_symbol = config.get("neutral_symbol", "=")
-
-    # Skip unchanged lines if configured to do so
-    include_unchanged = config.get("include_unchanged_lines", True)
-    if not include_unchanged:
-        # Filter out unchanged lines while keeping their respective line numbers in sync
-        filtered_diff_lines = []
-        filtered_line_numbers = []
-        for line, line_num in zip(diff_lines, line_numbers):
-            if not line.startswith(" "):  # Skip lines that start with space (unchanged)
-                filtered_diff_lines.append(line)
-                filtered_line_numbers.append(line_num)
-        diff_lines = filtered_diff_lines
-        line_numbers = filtered_line_numbers
-
-    total_rows = len(diff_lines)
-
-    for idx, (line, line_number) in enumerate(zip(diff_lines, line_numbers)):
-        row_cells = table.add_row().cells
-        symbol_cell = row_cells[0]
-        code_cell = row_cells[1]
-
-        # Apply background shading
-        if line.startswith("+"):
-            fill = config.get("add_color", "D0FFD0")
-            symbol = add_symbol
-        elif line.startswith("-"):
-            fill = config.get("remove_color", "FFD0D0")
-            symbol = remove_symbol
-        else:
-            fill = config.get("neutral_color", "F5F5F5")
-            symbol = neutral_symbol
-
-        # Background color for both cells
-        for cell in (symbol_cell, code_cell):
-            shading = parse_xml(r'<w:shd {} w:fill="{}"/>'.format(nsdecls("w"), fill))
-            cell._element.get_or_add_tcPr().append(shading)
-
-        # Determine which borders to remove
-        borders_to_remove_symbol = ["right"]
-        borders_to_remove_code = ["left"]
-
-        # For inner rows, remove top and bottom borders
-        if idx == 0:
-            borders_to_remove_symbol.append("bottom")
-            borders_to_remove_code.append("bottom")
-        elif idx == total_rows - 1:
-            borders_to_remove_symbol.append("top")
-            borders_to_remove_code.append("top")
+    return (
+        f'<w:tbl {w_nsdecls}><w:tblPr>'
+        f'<w:tblStyle w:val="{table_style_id}"/><w:tblW w:type="auto" w:w="0"/>'
+        '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" '
+        'w:noHBand="0" w:noVBand="1" w:val="04A0"/>'
+        "</w:tblPr><w:tblGrid>"
+        f'<w:gridCol w:w="{symbol_width.twips}"/><w:gridCol w:w="{code_width.twips}"/>'
+        f'</w:tblGrid>{"".join(rows)}</w:tbl>'
+    )
+
+# Paragraph properties of a line in the paragraph layout: the symbol hangs in
+# front of the code, and consecutive paragraphs with the same borders are drawn
+# by Word as one box around the whole diff
+diff_paragraph_borders_xml = "<w:pBdr>" + "".join(
+    f'<w:{border} w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    for border in ("top", "left", "bottom", "right")
+) + "</w:pBdr>"
+diff_paragraph_layout_xml = (
+    '<w:spacing w:before="0" w:after="0"/>'
+    f'<w:ind w:left="{symbol_width.twips}" w:hanging="{symbol_width.twips}"/>'
+)
+
+# Build the diff as one shaded paragraph per line instead of a table, which
+# Word and python-docx handle much faster for long diffs
+def diff_paragraphs_xml(diff_lines, lexer):
+    # Each paragraph is a top-level body element, so each declares the namespace
+    paragraph_start = f'<w:p {w_nsdecls}><w:pPr>{diff_paragraph_borders_xml}'
+    paragraphs = []
+    for line, line_number in diff_lines:
+        shading, symbol_run = line_kinds_xml.get(line[:1], neutral_line_xml)
+        paragraphs.append(
+            f"{paragraph_start}{shading}{diff_paragraph_layout_xml}</w:pPr>"
+            f"{symbol_run}<w:r><w:tab/></w:r>{line_runs_xml(lexer, line[1:])}</w:p>"
+        )
+    return "".join(paragraphs)
+
+# Page break (except for the first file) and heading that start a file section
+def file_heading_xml(index, file):
+    xml = ""
+    if not index == 0 and insert_page_breaks:
+        xml += f'<w:p {w_nsdecls}><w:r><w:br w:type="page"/></w:r></w:p>'
+    xml += (
+        f'<w:p {w_nsdecls}><w:pPr><w:pStyle w:val="{file_heading_style_id}"/></w:pPr>'
+        f"{run_xml(lang['file'] + ': ' + file, '')}</w:p>"
+    )
+    return xml
+
+# Parse a batch of body elements once and insert them in front of the section properties.
+# Each element declares the namespace itself: moving a large subtree whose namespace
+# is declared on a discarded parent is very slow in lxml.
+# The section properties are looked up once per batch, since a batch can hold
+# thousands of paragraphs and the lookup scans the whole body.
+def append_body_xml(document, xml):
+    body = document.element.body
+    sect_pr = body.find(qn("w:sectPr"))
+    for element in list(parse_xml(f"<body>{xml}</body>")):
+        if sect_pr is None:
+            body.append(element)
         else:
-            borders_to_remove_symbol.extend(["top", "bottom"])
-            borders_to_remove_code.extend(["top", "bottom"])
-
-        # Hide the border
-        remove_cell_border(symbol_cell, borders=borders_to_remove_symbol)
-        remove_cell_border(code_cell, borders=borders_to_remove_code)
-
-        # Set paragraph format for symbol cell
-        symbol_paragraph = symbol_cell.paragraphs[0]
-        symbol_paragraph.clear()
-        run_sym = symbol_paragraph.add_run(symbol)
-        run_sym.font.name = config.get("diff_font", "Courier New")
-        run_sym.font.size = Pt(int(config.get("diff_font_size", 8)))
-
-        # Clear and format code paragraph
-        paragraph = code_cell.paragraphs[0]
-        paragraph.clear()  # remove any auto-inserted text
-        paragraph.paragraph_format.space_before = Pt(0)
-        paragraph.paragraph_format.space_after = Pt(0)
-
-        # Strip symbol from content
-        code_content = line[1:]
-
-        # Lex and style each token
-        for ttype, value in lex(code_content, lexer):
-            value = value.rstrip('\n')
-            if not value:
-                value = "\u00A0" # Non-breaking space
-
-            run = paragraph.add_run(value)
-            run.font.name = config.get("diff_font", "Courier New")
-            run.font.size = Pt(int(config.get("diff_font_size", 8)))
-
-            style_str = token_styles.get(ttype)
-            if style_str:
-                for part in style_str.split():
-                    if part == "bold":
-                        run.bold = True
-                    elif part == "italic":
-                        run.italic = True
-                    elif part.startswith("#") and len(part) == 7:
-                        hexcode = part.lstrip("#")
-                        try:
-                            r = int(hexcode[0:2], 16)
-                            g = int(hexcode[2:4], 16)
-                            b = int(hexcode[4:6], 16)
-                            run.font.color.rgb = RGBColor(r, g, b)
-                        except ValueError:
-                            pass
+            sect_pr.addprevious(element)
 
 # Add images to the document
 def add_image(document, file_bytes, image_name):
     image_stream = io.BytesIO(file_bytes)
     try:
-        image = Image.open(image_stream)
-        width, _ = image.size
+        # Image.open() only reads the header, which is all that is needed for the size
+        with Image.open(image_stream) as image:
+            width, _ = image.size
+            dpi = image.info.get('dpi', (96, 96))[0]
         image_stream.seek(0)  # rewind for docx
         max_width_inches = 6  # ~75% of page width (8 inches)
-        width_inches = min(max_width_inches, width / image.info.get('dpi', (96, 96))[0])
-        document.add_picture(image_stream, width=Inches(width_inches))
-        document.paragraphs[-1].alignment = 1  # center
+        width_inches = min(max_width_inches, width / dpi)
+        # The picture paragraph is kept instead of looked up again through
+        # document.paragraphs, which builds a list of every paragraph in the body
+        paragraph = document.add_paragraph()
+        paragraph.add_run().add_picture(image_stream, width=Inches(width_inches))
+        paragraph.alignment = 1  # center
     except Exception as e:
         document.add_paragraph(lang["error_inserting_image"].format(image_name=image_name))
 
+# Streaming output: the body elements written so far are moved from the
+# in-memory document to a temporary spool file, so the document tree does not
+# grow with the diff size (the output of git diff is still read in full first)
+def spool_body(document, spool):
+    body = document.element.body
+    for element in list(body):
+        if element.tag != qn("w:sectPr"):
+            spool.write(etree.tostring(element, encoding="utf-8"))
+            body.remove(element)
+
+# Open the output .docx (a zip package) with the configured compression;
+# level 0 stores the parts uncompressed
+def open_package_zip(path):
+    if compress_level == 0:
+        return zipfile.ZipFile(path, "w", zipfile.ZIP_STORED)
+    return zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=compress_level)
+
+# python-docx always writes with the default DEFLATE level (6); a report is mostly
+# repetitive XML, so level 1 compresses it nearly as well in about half the time
+def init_zip_pkg_writer(self, pkg_file):
+    self._zipf = open_package_zip(pkg_file)
+
+phys_pkg._ZipPkgWriter.__init__ = init_zip_pkg_writer
+
+# Add a batch of body XML; when streaming, it is written straight to the spool
+# after whatever python-docx added so far, since removing large tables from the
+# document again is very slow in lxml.
+# Spooled XML is never parsed, so nothing checks that it is well-formed: all text
+# in it must go through xml_text(), or Word cannot open the saved report.
+def add_body_xml(document, spool, xml):
+    if spool is None:
+        append_body_xml(document, xml)
+    else:
+        spool_body(document, spool)
+        spool.write(xml.encode("utf-8"))
+
+# Number of diff lines above which "streaming_output": "auto" streams the report
+streaming_threshold_lines = 20000
+
+# Save the document (which now only holds the section properties, images and
+# styles) and splice the spooled body into its word/document.xml
+def save_streamed_document(document, spool, path):
+    template = io.BytesIO()
+    document.save(template)
+    with zipfile.ZipFile(template) as source, open_package_zip(path) as target:
+        for item in source.infolist():
+            if item.filename == "word/document.xml":
+                head, tail = source.read(item).split(b"<w:body>", 1)
+                with target.open(item.filename, "w", force_zip64=True) as document_xml:
+                    document_xml.write(head + b"<w:body>")
+                    spool.seek(0)
+                    shutil.copyfileobj(spool, document_xml)
+                    document_xml.write(tail)
+            else:
+                target.writestr(item.filename, source.read(item))
+
+# Render the diff of one text file as a table or as paragraphs, or None if it
+# has no lines to show.
+# Runs in worker processes unless worker_processes is set to 1.
+def render_file_table(file, hunk_lines):
+    if not hunk_lines:
+        return None
+
+    # Decode all lines with the configured encoding in one call (undecodable bytes are replaced)
+    hunk_lines = b"\n".join(hunk_lines).decode(file_encoding, errors="replace").split("\n")
+    diff_lines = list(numbered_diff_lines(hunk_lines))
+    if not diff_lines:
+        return None
+
+    # Choose lexer based on filename and content
+    sample = "\n".join(line[1:] for line, _ in diff_lines)
+    lexer = get_lexer(file, sample)
+
+    if diff_layout == "paragraphs":
+        return diff_paragraphs_xml(diff_lines, lexer)
+    return diff_table_xml(diff_lines, lexer)
+
+# Hand out the hunk lines of the given file diffs one at a time, dropping them from
+# the file diffs, so that each file's lines are freed once its table is rendered
+def take_hunk_lines(file_diffs):
+    for file_diff in file_diffs:
+        hunk_lines, file_diff[2] = file_diff[2], None
+        yield file_diff[0], hunk_lines
+
+# Like executor.map(), but only a few calls are submitted ahead of the result the
+# caller waits for; executor.map() submits all of them at once and keeps every
+# result (rendered tables, image blobs) in memory until it is taken
+def map_ahead(executor, function, arguments, calls_ahead):
+    pending = deque()
+    for args in arguments:
+        pending.append(executor.submit(function, *args))
+        if len(pending) > calls_ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+# Worker processes do not see the document, so they get its layout passed in
+def init_worker(document_code_width, document_table_style_id):
+    global code_width, table_style_id
+    code_width = document_code_width
+    table_style_id = document_table_style_id
+
 # ------------------------------------------------------------------------------
-# Main loop
+# Main
+# The interactive part only runs when the script is started directly, so that
+# worker processes can import this file without prompting again
+
+if __name__ == "__main__":
+    # ------------------------------------------------------------------------------
+    # Show banner
+
+    print_green(lang["title"])
 
-if os.path.exists(output_docx):
-    if not ask_yes_no(lang["output_exists"].format(output_docx=output_docx), lang):
-        print(lang["exiting"])
+    # ------------------------------------------------------------------------------
+    # Input prompts
+
+    while True:
+        target_dir = input(lang["enter_target_dir"] + " ").strip()
+        if not os.path.isdir(target_dir):
+            print_red(lang["invalid_target_dir"])
+            continue
+        if ".git" not in os.listdir(target_dir):
+            print_red(lang["no_git_repo_found"].format(target_dir=target_dir))
+            if ask_yes_no(lang["still_continue"], lang):
+                break
+            continue
+        os.chdir(target_dir)
+        break
+
+    # GDDIgnore
+    gdd_ignore_filename = config.get("gdd_ignore_file_name", ".gddignore")
+    gdd_ignore_path = os.path.join(target_dir, gdd_ignore_filename)
+    ignore_spec = None
+
+    if os.path.exists(gdd_ignore_path):
+        with open(gdd_ignore_path, "r", encoding="utf-8") as f:
+            ignore_spec = pathspec.PathSpec.from_lines("gitwildmatch", f)
+
+    # FIRST COMMIT
+    # The very first commit is both the default and needed for the check below
+    very_first_commit_hash = subprocess.run(
+        ["git", "rev-list", "--max-parents=0", "HEAD"],
+        capture_output=True, text=True, encoding="utf-8"
+    ).stdout.strip()
+
+    commit1 = input(lang["enter_commit1"] + " ").strip()
+    commit1_specified = bool(commit1)
+    if not commit1_specified:
+        commit1 = very_first_commit_hash
+
+    # Special case: if commit1 is the very first commit, we cannot add a caret
+    is_very_first_commit = (commit1 == very_first_commit_hash)
+
+
+    if not (commit1.endswith("^") or "~" in commit1) and commit1 != "HEAD":
+        include_first_commit = config.get("include_first_commit", False)
+
+        if is_very_first_commit and include_first_commit:
+            # Special revision number for an empty tree (state before any commit)
+            empty_tree = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+            commit1 = empty_tree
+        elif include_first_commit:
+            commit1 = f"{commit1}^" if include_first_commit else commit1
+
+    if not commit1_specified:
+        print(lang["using_first_commit"].format(commit1=commit1))
+
+    # LAST COMMIT
+    commit2 = input(lang["enter_commit2"] + " ").strip()
+    if not commit2:
+        commit2 = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True, text=True, encoding="utf-8"
+        ).stdout.strip()
+        print(lang["using_last_commit"].format(commit2=commit2))
+
+    output_docx = input(lang["enter_output_docx"] + " ").strip()
+    if not output_docx:
+        output_docx = os.path.join(script_dir, "output.docx")
+        print(lang["using_default_output"].format(output_docx=output_docx))
+
+    # ------------------------------------------------------------------------------
+    # Diff generation
+
+    # With unchanged lines included, the whole file is shown as context
+    context_lines = 1000000000 if include_unchanged_lines else 0
+
+    # The changed line counts for max_diff_lines come from the same git call,
+    # listed before the patches
+    numstat_options = ["--numstat", "--patch"] if max_diff_lines else []
+
+    # The diff itself is computed by git (in C); external diff drivers and textconv
+    # filters from the user's git config are disabled, since their output cannot be parsed.
+    # diff.suppressBlankEmpty would print blank context lines without their " " prefix.
+    diff_process = subprocess.Popen(
+        ["git", "-c", "core.quotepath=off", "-c", "diff.suppressBlankEmpty=false", "diff",
+         "--no-color", "--no-renames", "--no-ext-diff", "--no-textconv", *numstat_options,
+         f"--diff-algorithm={diff_algorithm}", "--src-prefix=a/", "--dst-prefix=b/",
+         f"--unified={context_lines}", commit1, commit2],
+        stdout=subprocess.PIPE
+    )
+    numstat, file_diffs = split_file_diffs(diff_process.stdout)
+    diff_process.wait()
+
+    file_diffs = [d for d in file_diffs if d[0] != gdd_ignore_filename]
+
+    # Files with too many changed lines get a note instead of a diff table,
+    # since rendering them takes long and makes the report unreadable anyway
+    too_large_files = {
+        file: lines for file, lines in parse_numstat(numstat).items()
+        if lines is not None and lines > max_diff_lines
+    }
+
+    if ignore_spec:
+        # All paths are matched in one call instead of one call per file
+        ignored_files = set(ignore_spec.match_files(d[0] for d in file_diffs))
+        file_diffs = [d for d in file_diffs if d[0] not in ignored_files]
+
+    if not file_diffs:
+        print_yellow(lang["no_changes_found"].format(commit1=commit1, commit2=commit2))
         exit()
-    else:
-        while True:
-            try:
-                with open(output_docx, "a", encoding="utf-8"):
-                    break
-            except Exception as e:
-                print_red(lang["error_removing_file"].format(output_docx=output_docx, error=str(e)))
-                input(lang["press_enter_to_retry"])
 
-verbose = config.get("verbose", False)
+    # ------------------------------------------------------------------------------
+    # Word document generation
+
+    doc = Document()
+    doc.add_heading(f"{lang['git_changes_report']} ({commit1} → {commit2})", level=1)
+    doc.add_paragraph(lang["report_generated_on"].format(
+        date=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    ))
+
+    doc.add_heading(lang["legend"], level=heading_level)
+    add_legend_table(doc)
+
+    doc.add_page_break()
+    doc.add_heading(lang["diffs"], level=heading_level)
+
+    # Layout and styles shared by all file sections, looked up once
+    code_width = Emu(get_usable_width(doc) - symbol_width)
+    table_style_id = doc.styles["Table Grid"].style_id
+    file_heading_style_id = doc.styles[f"Heading {heading_level + 1}"].style_id
+
+    # ------------------------------------------------------------------------------
+    # Main loop
+
+    if os.path.exists(output_docx):
+        if not ask_yes_no(lang["output_exists"].format(output_docx=output_docx), lang):
+            print(lang["exiting"])
+            exit()
+
+    verbose = config.get("verbose", False)
+
+    # Blobs are only read for images, so most reports need no cat-file process.
+    # A background thread reads the next image while the diffs are rendered; it
+    # is the only user of the cat-file pipe, so no locking is needed.
+    image_files = [file for file, is_binary, _ in file_diffs if is_binary and is_image_file(file)] if include_images else []
+    cat_file = image_reader = None
+    if image_files:
+        cat_file = start_cat_file()
+        image_reader = ThreadPoolExecutor(max_workers=1)
+        images = map_ahead(image_reader, read_blob, ((cat_file, f"{commit2}:{file}") for file in image_files), 1)
+
+    # With "auto", only large diffs are streamed; small reports are kept in memory.
+    # The decision counts the lines of the diff already read, since git diff does
+    # not tell the size up front.
+    streaming_output = config.get("streaming_output", "auto")
+    if streaming_output == "auto":
+        streaming_output = sum(len(hunk_lines) for _, _, hunk_lines in file_diffs) > streaming_threshold_lines
+    spool = tempfile.TemporaryFile() if streaming_output else None
+
+    # Diff tables are rendered in input order, in parallel if configured
+    text_hunks = take_hunk_lines([d for d in file_diffs if not d[1] and d[0] not in too_large_files])
+    if worker_processes == 1:
+        executor = None
+        tables = (render_file_table(file, hunk_lines) for file, hunk_lines in text_hunks)
+    else:
+        executor = ProcessPoolExecutor(
+            max_workers=worker_processes or None,
+            initializer=init_worker, initargs=(code_width, table_style_id)
+        )
+        # Two files per worker keep all of them busy
+        tables = map_ahead(executor, render_file_table, text_hunks, 2 * (worker_processes or os.cpu_count() or 1))
 
-for index, file in enumerate(changed_files):
-    if not index == 0 and config.get("insert_page_breaks", True):
-        doc.add_page_break()
+    # Number of file sections written so far; only the first one has no page break
+    section_index = 0
 
-    doc.add_heading(f"{lang['file']}: {file}", level=config.get("heading_level", 2) + 1)
+    for file, is_binary, _ in file_diffs:
+        if verbose:
+            print(lang["processing_file"].format(file=file))
 
-    if verbose:
-        print(lang["processing_file"].format(file=file))
+        # Files without lines to show (e.g. only a mode change) get no section at all
+        if not is_binary and file not in too_large_files:
+            table_xml = next(tables)
+            if not table_xml:
+                continue
 
-    # Try to get binary contents
-    try:
-        old_bytes = subprocess.run(
-            ["git", "show", f"{commit1}:{file}"],
-            capture_output=True
-        ).stdout
-    except:
-        old_bytes = b""
+        section_xml = file_heading_xml(section_index, file)
+        section_index += 1
 
-    try:
-        new_bytes = subprocess.run(
-            ["git", "show", f"{commit2}:{file}"],
-            capture_output=True
-        ).stdout
-    except:
-        new_bytes = b""
-
-    # If binary but not image → skip
-    if is_binary_string(new_bytes) or is_binary_string(old_bytes):
-        if is_image_file(file):
-            # Insert only if the image changed
-            if old_bytes != new_bytes:
+        # If binary but not image → skip
+        if is_binary:
+            add_body_xml(doc, spool, section_xml)
+            if is_image_file(file):
                 paragraph = doc.add_paragraph()
                 run = paragraph.add_run(lang['image_changed'])
                 run.italic = True
 
-                if config.get("include_images", True):
-                    add_image(doc, new_bytes, file)
-        else:
+                # A deleted image has no content in the last commit
+                image_bytes = next(images) if include_images else b""
+                if image_bytes:
+                    add_image(doc, image_bytes, file)
+            else:
+                paragraph = doc.add_paragraph()
+                run = paragraph.add_run(lang['binary_file_skipped'])
+                run.italic = True
+            continue
+
+        if file in too_large_files:
+            add_body_xml(doc, spool, section_xml)
             paragraph = doc.add_paragraph()
-            run = paragraph.add_run(lang['binary_file_skipped'])
+            run = paragraph.add_run(lang["file_too_large"].format(lines=too_large_files[file], max_lines=max_diff_lines))
             run.italic = True
-        continue
+            continue
 
-    # Fallback for text diff
-    old_content = old_bytes.decode(file_encoding, errors="ignore").splitlines()
-    new_content = new_bytes.decode(file_encoding, errors="ignore").splitlines()
+        # Add the table together with the heading
+        add_body_xml(doc, spool, section_xml + table_xml)
 
-    # Choose lexer based on filename and content
-    sample = "\n".join(new_content or old_content)
-    try:
-        lexer = guess_lexer_for_filename(file, sample)
-    except:
-        lexer = guess_lexer(sample or "")
-
-    matcher = SequenceMatcher(None, old_content, new_content)
-    diff_lines = []
-    line_nums = []
-
-    old_idx = new_idx = 0
-
-    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-        if tag == "equal":
-            # Only add unchanged lines if configured to do so
-            if config.get("include_unchanged_lines", True):
-                for line in new_content[j1:j2]:
-                    diff_lines.append(f" {line}")
-                    line_nums.append(new_idx + 1)
-                    new_idx += 1
-                    old_idx += 1
-            else:
-                # Still need to update indices even if we don't add the lines
-                new_idx += (j2 - j1)
-                old_idx += (i2 - i1)
-        elif tag == "replace":
-            for line in old_content[i1:i2]:
-                diff_lines.append(f"-{line}")
-                line_nums.append(old_idx + 1)
-                old_idx += 1
-            for line in new_content[j1:j2]:
-                diff_lines.append(f"+{line}")
-                line_nums.append(new_idx + 1)
-                new_idx += 1
-        elif tag == "delete":
-            for line in old_content[i1:i2]:
-                diff_lines.append(f"-{line}")
-                line_nums.append(old_idx + 1)
-                old_idx += 1
-        elif tag == "insert":
-            for line in new_content[j1:j2]:
-                diff_lines.append(f"+{line}")
-                line_nums.append(new_idx + 1)
-                new_idx += 1
-
-    # Add Table if there are significant changes
-    if diff_lines:
-        add_diff_table(doc, diff_lines, line_nums, lexer)
-    else:
-        doc.add_paragraph(lang["no_significant_changes"], style="Italic")
+        if verbose:
+            print_green(lang["processing_done"].format(file=file))
 
-    if verbose:
-        print_green(lang["processing_done"].format(file=file))
+    if executor:
+        executor.shutdown()
 
-try:
-    doc.save(output_docx)
-except Exception as e:
-    print_red(lang["error_saving_file"].format(output_docx=output_docx, error=str(e)))
-    exit()
+    if image_reader:
+        image_reader.shutdown()
+        cat_file.stdin.close()
+        cat_file.wait()
 
-print_green(lang["saving_report"].format(output_docx=output_docx))
+    if streaming_output:
+        spool_body(doc, spool)
 
-if config.get("open_after_creation", False):
-    try:
-        os.startfile(output_docx)
-    except Exception as e:
-        print_red(lang["error_opening_file"].format(output_docx=output_docx, error=str(e)))
-        exit()
\ No newline at end of file
+    # Saving fails with a PermissionError if the output file is still open in Word,
+    # so the user can close it and retry without losing the generated report;
+    # other errors (e.g. a missing output directory) do not go away by retrying
+    while True:
+        try:
+            if streaming_output:
+                save_streamed_document(doc, spool, output_docx)
+            else:
+                doc.save(output_docx)
+            break
+        except PermissionError as e:
+            print_red(lang["error_saving_file"].format(output_docx=output_docx, error=str(e)))
+            try:
+                input(lang["press_enter_to_retry"])
+            except (EOFError, KeyboardInterrupt):
+                sys.exit(1)
+        except Exception as e:
+            print_red(lang["error_saving_file"].format(output_docx=output_docx, error=str(e)))
+            sys.exit(1)
+
+    if streaming_output:
+        spool.close()
+
+    print_green(lang["saving_report"].format(output_docx=output_docx))
+
+    if config.get("open_after_creation", False):
+        try:
+            os.startfile(output_docx)
+        except Exception as e:
+            print_red(lang["error_opening_file"].format(output_docx=output_docx, error=str(e)))
+            exit()